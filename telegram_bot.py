@@ -10,15 +10,17 @@
 
 說明：
 - 使用 python-telegram-bot v20 (async API)
-- 使用 APScheduler 的 AsyncIO 排程器做背景提醒
-- 狀態儲存在本機 JSON 檔 state.json
+- 使用 python-telegram-bot 內建的 JobQueue 做背景提醒
+- 狀態儲存在本機 JSON 檔 state.json，尚未發送的提醒也記在裡面，重啟後會自動還原
+- 每次變動先附加到 state.log，定期再壓縮成新的 state.json 快照
 
 安裝套件：
-    pip install python-telegram-bot>=20.0 apscheduler requests
+    pip install "python-telegram-bot[job-queue]>=20.0" httpx orjson
 
 設定環境變數：
     TELEGRAM_TOKEN - 你的 Bot Token
     OPENWEATHER_API_KEY - 你的 OpenWeather API Key（若沒有，可留空再填入程式）
+    LOG_LEVEL - 日誌等級（預設 WARNING，除錯時可設為 INFO 或 DEBUG）
 
 範例：
     export TELEGRAM_TOKEN="你的_token"
@@ -28,20 +30,26 @@
 """
 
 import os
-import json
+import re
+import shutil
+import time
+import random
+import asyncio
 import logging
-from datetime import datetime, timedelta, time as dtime
-from typing import Dict, Any
+from collections import OrderedDict
+from contextlib import suppress
+from datetime import datetime, timedelta, timezone, time as dtime
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import quote, quote_plus
 
-import requests
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.date import DateTrigger
+import httpx
+import orjson
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
-    CommandHandler,
     ContextTypes,
+    JobQueue,
     MessageHandler,
     CallbackQueryHandler,
     filters,
@@ -50,29 +58,115 @@ from telegram.ext import (
 # -------------------- 設定 --------------------
 PET_NAME = "貓貓"  # 寵物名字
 STATE_FILE = "state.json"
+JOURNAL_FILE = "state.log"  # state.json 快照之後的變動紀錄
+JOURNAL_ROTATED = JOURNAL_FILE + ".1"
+TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN', "")
 OPENWEATHER_API_KEY = os.getenv('OPENWEATHER_API_KEY', "")
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'WARNING').upper()
 
 # 提醒閾值（小時）
 FEED_THRESHOLD_HOURS = 6
 DRINK_THRESHOLD_HOURS = 4
 SLEEP_THRESHOLD_HOURS = 18
+CHECK_INTERVAL_MINUTES = 30  # 週期檢查間隔
 
-# 日誌
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+# state.log 壓縮進 state.json 快照的間隔（秒）
+COMPACT_INTERVAL_SECONDS = 300
+
+# 外部 API 查詢結果的快取時間（秒）與筆數上限
+WEATHER_CACHE_TTL = 600
+WIKI_CACHE_TTL = 24 * 3600
+CACHE_MAX_ENTRIES = 512
+
+# 日誌：LOG_LEVEL 打錯時退回 WARNING，不讓 basicConfig 在啟動時丟例外
+_log_level = logging.getLevelName(LOG_LEVEL)  # 已知的等級名稱會回傳 int
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=_log_level if isinstance(_log_level, int) else logging.WARNING,
+)
 logger = logging.getLogger(__name__)
+if not isinstance(_log_level, int):
+    logger.warning('未知的 LOG_LEVEL：%r，改用 WARNING', LOG_LEVEL)
 
-# 初始化排程器
-scheduler = AsyncIOScheduler()
+# 共用的 HTTP client（連線池 + keep-alive），於 post_shutdown 關閉
+HTTP = httpx.AsyncClient(timeout=10, limits=httpx.Limits(max_keepalive_connections=20))
 
 # 內建笑話清單（可擴充）
 JOKES = [
     "為什麼電腦很會唱歌？因為有很多記憶體（memory）！",
     "為什麼貓咪不喜歡上網？因為牠怕抓不到滑鼠。",
-    "有一天一隻喵說："嗨！"，另一隻喵問：你喵什麼？",
+    "有一天一隻喵說：「嗨！」，另一隻喵問：你喵什麼？",
     "為什麼程序員喜歡夏天？因為可以穿短路（short-circuit）！",
 ]
+# 笑話清單啟動後不再變動，先轉成 tuple 並記下長度，抽籤時直接取索引
+_JOKES_T = tuple(JOKES)
+_JOKE_N = len(_JOKES_T)
+_randrange = random.randrange
+
+# 自動回覆的打招呼關鍵字，預先編譯成單一 regex
+GREETING_WORDS = ['你好', '嗨', '哈囉']
+_GREET_RE = re.compile('|'.join(map(re.escape, GREETING_WORDS))).search
+
+# 固定的回覆訊息，啟動時組好一次
+FEED_MSG = f"你餵了 {PET_NAME}！牠開心地吃光了 🍽️"
+DRINK_MSG = f"你給了 {PET_NAME} 水喝！牠咕嚕咕嚕喝完了 💧"
+SLEEP_MSG = f"{PET_NAME} 去睡覺了... 乖乖睡好覺 😴"
+GREET_MSG = f"嗨！我是 {PET_NAME}，要來餵我嗎？試試 /feed /drink /sleep"
+UNKNOWN_MSG = "我不太懂你的話，但你可以試試 /help 看看我會哪些指令！"
+HELP_MSG = (
+    "指令清單：\n"
+    f"/feed - 餵食{PET_NAME}\n"
+    f"/drink - 給{PET_NAME}喝水\n"
+    f"/sleep - 讓{PET_NAME}睡覺\n"
+    "/joke - 隨機笑話\n"
+    "/remind HH:MM 內容 - 安排單次提醒\n"
+    "/weather 城市 - 查詢天氣（OpenWeather）\n"
+    "/google 關鍵字 - 傳回 Google 搜尋連結\n"
+    "/wiki 主題 - 傳回維基百科摘要"
+)
+
+# /start 的固定按鈕
+_START_KB = InlineKeyboardMarkup([[InlineKeyboardButton("給我一個笑話", callback_data='joke_cb')]])
 
 # -------------------- 狀態儲存／讀取 --------------------
+# state.json 是快照；之後的每次變動以一行 JSON 附加到 state.log，
+# 背景任務定期把目前狀態寫成新快照並清掉 log，啟動時則先讀快照再重播 log。
+
+def _apply_record(state: Dict[str, Any], rec: Dict[str, Any]) -> None:
+    # 每種紀錄重播多次結果都一樣，所以快照已包含的紀錄再重播也沒關係
+    op = rec['op']
+    if op in ('feed', 'drink', 'sleep'):
+        state['last_' + op] = rec['ts']
+    elif op == 'remind':
+        val = rec['val']
+        state['reminders'][val['job_id']] = val['reminder']
+        state['_rid'] = max(state.get('_rid', 0), val['rid'])
+    elif op == 'remind_done':
+        state['reminders'].pop(rec['val'], None)
+
+
+def replay_journal(state: Dict[str, Any]) -> int:
+    count = 0
+    # JOURNAL_ROTATED 是壓縮途中被換下、還沒寫進快照的舊 log
+    for path in (JOURNAL_ROTATED, JOURNAL_FILE):
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            for line in f:
+                try:
+                    rec = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    continue  # 寫到一半中斷的最後一行
+                _apply_record(state, rec)
+                count += 1
+    return count
+
+
+def _remove_journals() -> None:
+    for path in (JOURNAL_ROTATED, JOURNAL_FILE):
+        if os.path.exists(path):
+            os.remove(path)
+
 
 def load_state() -> Dict[str, Any]:
     if not os.path.exists(STATE_FILE):
@@ -81,94 +175,219 @@ def load_state() -> Dict[str, Any]:
             "last_drink": None,
             "last_sleep": None,
             "users": {},  # 可擴充儲存每個使用者的資料
-            "reminders": [],  # 儲存已登記的提醒 (供重啟時恢復)
+            "reminders": {},  # job_id -> 尚未發送的提醒 (供重啟時恢復)，發送後移除
+            "_rid": 0,  # 提醒編號計數器
         }
+    else:
+        with open(STATE_FILE, 'rb') as f:
+            state = orjson.loads(f.read())
+        # 舊版以 ISO 字串（UTC）儲存時間，轉成 unix timestamp
+        for key in ('last_feed', 'last_drink', 'last_sleep'):
+            if isinstance(state.get(key), str):
+                state[key] = datetime.fromisoformat(state[key]).replace(tzinfo=timezone.utc).timestamp()
+        # 更舊的版本以 list 儲存提醒（且不會還原），直接捨棄
+        if not isinstance(state.get('reminders'), dict):
+            state['reminders'] = {}
+    # 重播上次快照之後的 log，並立刻寫成新快照
+    if replay_journal(state) or not os.path.exists(STATE_FILE):
         save_state(state)
-        return state
-    with open(STATE_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
+        _remove_journals()
+    return state
+
+
+def _write_state(data: bytes) -> None:
+    # 先寫到暫存檔再換名，避免寫到一半中斷時留下損壞的 state.json
+    tmp = STATE_FILE + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, STATE_FILE)
 
 
 def save_state(state: Dict[str, Any]) -> None:
-    with open(STATE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(state, f, ensure_ascii=False, indent=2)
+    _write_state(orjson.dumps(state, option=orjson.OPT_INDENT_2))
+
+
+async def save_state_async(state: Dict[str, Any]) -> None:
+    # 在 event loop 上序列化（即是當下的快照），寫檔則丟到 thread，期間 handler 可繼續修改 state
+    data = orjson.dumps(state, option=orjson.OPT_INDENT_2)
+    await asyncio.to_thread(_write_state, data)
 
 
 state = load_state()
 
+# log 中有尚未寫進快照的紀錄時設定，由背景 _flusher 定期壓縮
+_dirty = asyncio.Event()
+# 記憶體中有紀錄等著附加到 log 時設定，由背景 _journal_writer 寫檔
+_journal_pending = asyncio.Event()
+_journal_buf: List[bytes] = []
+# state.log 的 append handle；寫入、換下 log 都在持有 _state_lock 時進行
+_journal_fh = None
+_state_lock = asyncio.Lock()
+_flush_task = None
+_journal_task = None
+
+
+def journal(op: str, val: Any = None) -> None:
+    # 套用到記憶體中的 state，紀錄先放進 buffer，由 _journal_writer 在背景附加到 log，
+    # handler 回覆前不會碰到磁碟
+    rec = {'op': op, 'ts': now_ts(), 'val': val}
+    _apply_record(state, rec)
+    _journal_buf.append(orjson.dumps(rec) + b'\n')
+    _journal_pending.set()
+    _dirty.set()
+
+
+def _append_journal(data: bytes) -> None:
+    global _journal_fh
+    if _journal_fh is None:
+        _journal_fh = open(JOURNAL_FILE, 'ab')
+    _journal_fh.write(data)
+    _journal_fh.flush()
+
+
+def _close_journal() -> None:
+    global _journal_fh
+    if _journal_fh is not None:
+        _journal_fh.close()
+        _journal_fh = None
+
+
+async def write_journal() -> None:
+    # 把 buffer 中的紀錄一次附加到 state.log；呼叫端需持有 _state_lock
+    if not _journal_buf:
+        return
+    data = b''.join(_journal_buf)
+    _journal_buf.clear()
+    try:
+        await asyncio.to_thread(_append_journal, data)
+    except Exception:
+        # 寫入失敗時把紀錄放回 buffer，下次再寫
+        _journal_buf.insert(0, data)
+        raise
+
+
+def _rotate_journal() -> None:
+    _close_journal()
+    if not os.path.exists(JOURNAL_FILE):
+        return
+    if os.path.exists(JOURNAL_ROTATED):
+        # 上次壓縮失敗留下的舊 log 還沒寫進快照，接在它後面而不是覆蓋
+        with open(JOURNAL_FILE, 'rb') as src, open(JOURNAL_ROTATED, 'ab') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(JOURNAL_FILE)
+    else:
+        os.replace(JOURNAL_FILE, JOURNAL_ROTATED)
+
+
+async def compact_state() -> None:
+    # 呼叫端需持有 _state_lock，期間不會有紀錄附加到 log。記憶體中的 state 已套用所有紀錄
+    # （包含還在 buffer 裡的），所以換下 log 之後序列化的快照一定涵蓋它
+    await asyncio.to_thread(_rotate_journal)
+    await save_state_async(state)
+    # 快照已包含換下的 log
+    if os.path.exists(JOURNAL_ROTATED):
+        os.remove(JOURNAL_ROTATED)
+
+
+async def _journal_writer() -> None:
+    while True:
+        await _journal_pending.wait()
+        _journal_pending.clear()
+        async with _state_lock:
+            try:
+                await write_journal()
+            except Exception:
+                logger.exception('寫入 state.log 失敗')
+
+
+async def _flusher() -> None:
+    # 有新紀錄後等 COMPACT_INTERVAL_SECONDS，把這段期間的紀錄一次壓縮進快照
+    while True:
+        await _dirty.wait()
+        await asyncio.sleep(COMPACT_INTERVAL_SECONDS)
+        _dirty.clear()
+        async with _state_lock:
+            try:
+                await compact_state()
+            except Exception:
+                # 留著 log 下次再壓縮，背景任務不能因此停掉
+                logger.exception('壓縮 state.log 失敗')
+                _dirty.set()
+
 
 # -------------------- 工具函式 --------------------
 
-def iso_now() -> str:
-    return datetime.utcnow().isoformat()
+def now_ts() -> float:
+    return time.time()
+
+
+def time_since_hours(ts: Optional[float], now: Optional[float] = None) -> float:
+    # now 可由呼叫端傳入，一次檢查多個項目時只讀一次時鐘
+    if not ts:
+        return float('inf')
+    if now is None:
+        now = time.time()
+    return (now - ts) / 3600.0
+
+
+def fmt_ts(ts: Optional[float]) -> str:
+    # 直接用 time.strftime 格式化 UTC 時間，不建立 datetime 物件
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(ts)) if ts else '從未'
 
 
-def parse_iso(dt_str: str):
-    if not dt_str:
+# 查詢快取：key -> (到期時間, 值)，依使用順序排列，超過上限時丟掉最舊的
+# 天氣存解析後的 (描述, 溫度, 濕度)，回覆時再套上這次查詢的城市名稱；維基直接存回覆文字
+_weather_cache: 'OrderedDict[str, Tuple[float, Tuple[str, float, int]]]' = OrderedDict()
+_wiki_cache: 'OrderedDict[str, Tuple[float, str]]' = OrderedDict()
+
+
+def cache_get(cache: 'OrderedDict[str, Tuple[float, Any]]', key: str) -> Optional[Any]:
+    hit = cache.get(key)
+    if hit is None:
+        return None
+    expiry, value = hit
+    if time.monotonic() >= expiry:
+        del cache[key]
         return None
-    return datetime.fromisoformat(dt_str)
+    cache.move_to_end(key)
+    return value
 
 
-def time_since_hours(dt_str: str) -> float:
-    dt = parse_iso(dt_str)
-    if not dt:
-        return float('inf')
-    delta = datetime.utcnow() - dt
-    return delta.total_seconds() / 3600.0
+def cache_put(cache: 'OrderedDict[str, Tuple[float, Any]]', key: str, value: Any, ttl: float) -> None:
+    cache[key] = (time.monotonic() + ttl, value)
+    cache.move_to_end(key)
+    if len(cache) > CACHE_MAX_ENTRIES:
+        cache.popitem(last=False)
 
 
 # -------------------- Handlers --------------------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user = update.effective_user
-    text = f"嗨，{user.first_name or '朋友'}！我是你的智慧寵物 {PET_NAME} 🐾
-試試 /feed /drink /sleep /joke /weather /remind /google /wiki"
-    keyboard = [[InlineKeyboardButton("給我一個笑話", callback_data='joke_cb')]]
-    await update.message.reply_text(text, reply_markup=InlineKeyboardMarkup(keyboard))
+    text = f"嗨，{user.first_name or '朋友'}！我是你的智慧寵物 {PET_NAME} 🐾\n試試 /feed /drink /sleep /joke /weather /remind /google /wiki"
+    await update.message.reply_text(text, reply_markup=_START_KB)
 
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    await update.message.reply_text(
-        "指令清單：
-"
-        "/feed - 餵食貓貓
-"
-        "/drink - 給貓貓喝水
-"
-        "/sleep - 讓貓貓睡覺
-"
-        "/joke - 隨機笑話
-"
-        "/remind HH:MM 內容 - 安排單次提醒
-"
-        "/weather 城市 - 查詢天氣（OpenWeather）
-"
-        "/google 關鍵字 - 傳回 Google 搜尋連結
-"
-        "/wiki 主題 - 傳回維基百科摘要"
-    )
+    await update.message.reply_text(HELP_MSG)
 
 
 async def joke_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    import random
-    await update.message.reply_text(random.choice(JOKES))
+    await update.message.reply_text(_JOKES_T[_randrange(_JOKE_N)])
 
 
 async def feed_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    state['last_feed'] = iso_now()
-    save_state(state)
-    await update.message.reply_text(f"你餵了 {PET_NAME}！牠開心地吃光了 🍽️")
+    journal('feed')
+    await update.message.reply_text(FEED_MSG)
 
 
 async def drink_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    state['last_drink'] = iso_now()
-    save_state(state)
-    await update.message.reply_text(f"你給了 {PET_NAME} 水喝！牠咕嚕咕嚕喝完了 💧")
+    journal('drink')
+    await update.message.reply_text(DRINK_MSG)
 
 
 async def sleep_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    state['last_sleep'] = iso_now()
-    save_state(state)
-    await update.message.reply_text(f"{PET_NAME} 去睡覺了... 乖乖睡好覺 😴")
+    journal('sleep')
+    await update.message.reply_text(SLEEP_MSG)
 
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -176,18 +395,11 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     lf = state.get('last_feed')
     ld = state.get('last_drink')
     ls = state.get('last_sleep')
-    def fmt(t):
-        return parse_iso(t).strftime('%Y-%m-%d %H:%M:%S') if t else '從未'
-
     text = (
-        f"{PET_NAME} 狀態：
-"
-        f"最後餵食：{fmt(lf)}
-"
-        f"最後喝水：{fmt(ld)}
-"
-        f"最後睡覺：{fmt(ls)}
-"
+        f"{PET_NAME} 狀態：\n"
+        f"最後餵食：{fmt_ts(lf)}\n"
+        f"最後喝水：{fmt_ts(ld)}\n"
+        f"最後睡覺：{fmt_ts(ls)}\n"
     )
     await update.message.reply_text(text)
 
@@ -212,32 +424,44 @@ async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     content = ' '.join(args[1:])
 
-    # 排程一個單次提醒
-    job_id = f"remind_{len(state.get('reminders', [])) + 1}_{int(target.timestamp())}"
-    scheduler.add_job(send_reminder_job, trigger=DateTrigger(run_date=target), args=(update.effective_chat.id, content), id=job_id)
-
-    # 記錄到 state（重啟後目前不會自動還原排程，這裡只是示範儲存）
-    state.setdefault('reminders', []).append({
-        'job_id': job_id,
-        'run_at': target.isoformat(),
+    # 排程一個單次提醒，並記錄到 state 供重啟後還原
+    run_at = now_ts() + (target - now).total_seconds()
+    rid = state.get('_rid', 0) + 1
+    job_id = f"remind_{rid}_{int(run_at)}"
+    reminder = {
+        'run_at': run_at,
         'chat_id': update.effective_chat.id,
         'content': content,
-    })
-    save_state(state)
+    }
+    journal('remind', {'job_id': job_id, 'rid': rid, 'reminder': reminder})
+    schedule_reminder(context.job_queue, job_id, reminder)
 
     local_time = target.isoformat()  # 因為用 UTC，顯示為 UTC 時間
-    await update.message.reply_text(f"已為你安排提醒：{content}
-提醒時間 (UTC)：{local_time}")
+    await update.message.reply_text(f"已為你安排提醒：{content}\n提醒時間 (UTC)：{local_time}")
+
+
+def schedule_reminder(job_queue: JobQueue, job_id: str, reminder: Dict[str, Any]) -> None:
+    # 重啟時已過期的提醒會立即補發；JobQueue 預設只容許 1 秒誤差，
+    # 啟動較慢或 event loop 忙碌時提醒會被當成錯過而丟掉，所以不設上限
+    job_queue.run_once(
+        send_reminder_job,
+        when=max(reminder['run_at'] - now_ts(), 0),
+        chat_id=reminder['chat_id'],
+        data=reminder['content'],
+        name=job_id,
+        job_kwargs={'misfire_grace_time': None},
+    )
 
 
-async def send_reminder_job(chat_id: int, content: str) -> None:
-    # 透過 Application 發送訊息：先取得 application
-    app = Application.builder().token(os.getenv('TELEGRAM_TOKEN') or '').build()  # 臨時建立 client 用於發送
-    # 注意：在 production 中應該取得長期可用的 bot instance，而不是每次建立。
+async def send_reminder_job(context: ContextTypes.DEFAULT_TYPE) -> None:
+    job = context.job
     try:
-        await app.bot.send_message(chat_id=chat_id, text=f"🔔 提醒：{content}")
+        await context.bot.send_message(chat_id=job.chat_id, text=f"🔔 提醒：{job.data}")
     except Exception as e:
         logger.exception("無法發送提醒：%s", e)
+    # 已觸發的提醒不再保留
+    if job.name in state['reminders']:
+        journal('remind_done', job.name)
 
 
 async def weather_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -249,9 +473,15 @@ async def weather_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         await update.message.reply_text("使用方式：/weather 城市")
         return
     city = ' '.join(args)
+    key = city.lower()
+    cached = cache_get(_weather_cache, key)
+    if cached is not None:
+        desc, temp, hum = cached
+        await update.message.reply_text(f"{city} 天氣：{desc}\n溫度：{temp}°C\n濕度：{hum}%")
+        return
     try:
-        url = f"https://api.openweathermap.org/data/2.5/weather?q={city}&appid={OPENWEATHER_API_KEY}&units=metric&lang=zh_tw"
-        resp = requests.get(url, timeout=10)
+        url = f"https://api.openweathermap.org/data/2.5/weather?q={quote_plus(city)}&appid={OPENWEATHER_API_KEY}&units=metric&lang=zh_tw"
+        resp = await HTTP.get(url)
         data = resp.json()
         if resp.status_code != 200:
             await update.message.reply_text(f"查詢失敗：{data.get('message', '未知錯誤')}")
@@ -259,10 +489,8 @@ async def weather_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         desc = data['weather'][0]['description']
         temp = data['main']['temp']
         hum = data['main']['humidity']
-        text = f"{city} 天氣：{desc}
-溫度：{temp}°C
-濕度：{hum}%"
-        await update.message.reply_text(text)
+        cache_put(_weather_cache, key, (desc, temp, hum), WEATHER_CACHE_TTL)
+        await update.message.reply_text(f"{city} 天氣：{desc}\n溫度：{temp}°C\n濕度：{hum}%")
     except Exception as e:
         logger.exception("weather error: %s", e)
         await update.message.reply_text("查詢天氣時發生錯誤，請稍後再試。")
@@ -272,7 +500,7 @@ async def google_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     if not context.args:
         await update.message.reply_text("使用方式：/google 關鍵字")
         return
-    q = '+'.join(context.args)
+    q = quote_plus(' '.join(context.args))
     url = f"https://www.google.com/search?q={q}"
     await update.message.reply_text(f"Google 搜尋連結：{url}")
 
@@ -282,19 +510,23 @@ async def wiki_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await update.message.reply_text("使用方式：/wiki 主題")
         return
     title = '_'.join(context.args)
+    cached = cache_get(_wiki_cache, title)
+    if cached is not None:
+        await update.message.reply_text(cached)
+        return
     try:
-        url = f"https://zh.wikipedia.org/api/rest_v1/page/summary/{title}"
-        resp = requests.get(url, timeout=10)
+        url = f"https://zh.wikipedia.org/api/rest_v1/page/summary/{quote(title, safe='')}"
+        resp = await HTTP.get(url)
         if resp.status_code != 200:
             await update.message.reply_text("找不到該維基條目或發生錯誤。")
             return
         j = resp.json()
         extract = j.get('extract')
         page_url = j.get('content_urls', {}).get('desktop', {}).get('page')
-        text = f"{extract}
-
-閱讀更多：{page_url}" if extract else f"找不到摘要，請試試其他關鍵字。
-{page_url}"
+        text = f"{extract}\n\n閱讀更多：{page_url}" if extract else f"找不到摘要，請試試其他關鍵字。\n{page_url}"
+        if extract:
+            # 只快取真正的摘要；「找不到摘要」之後可能就有了，不該卡住一整天
+            cache_put(_wiki_cache, title, text, WIKI_CACHE_TTL)
         await update.message.reply_text(text)
     except Exception as e:
         logger.exception("wiki error: %s", e)
@@ -305,74 +537,130 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     query = update.callback_query
     await query.answer()
     if query.data == 'joke_cb':
-        import random
-        await query.edit_message_text(random.choice(JOKES))
+        await query.edit_message_text(_JOKES_T[_randrange(_JOKE_N)])
 
 
 async def text_message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     # 簡單關鍵字自動回覆（例如「你好」）
     text = update.message.text.strip()
-    if any(w in text for w in ['你好', '嗨', '哈囉']):
-        await update.message.reply_text(f"嗨！我是 {PET_NAME}，要來餵我嗎？試試 /feed /drink /sleep")
+    if _GREET_RE(text):
+        await update.message.reply_text(GREET_MSG)
     else:
-        await update.message.reply_text("我不太懂你的話，但你可以試試 /help 看看我會哪些指令！")
+        await update.message.reply_text(UNKNOWN_MSG)
 
 
 async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     logger.exception("Exception while handling an update: %s", context.error)
 
 
+# 指令名稱 -> handler，由 dispatch_command 以一次 dict 查詢分派
+COMMAND_MAP = {
+    'start': start,
+    'help': help_command,
+    'joke': joke_command,
+    'feed': feed_command,
+    'drink': drink_command,
+    'sleep': sleep_command,
+    'status': status_command,
+    'remind': remind_command,
+    'weather': weather_command,
+    'google': google_command,
+    'wiki': wiki_command,
+}
+
+
+async def dispatch_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # 取代逐一檢查的 CommandHandler：解析 "/cmd@bot 參數..." 後直接查表
+    message = update.message
+    if message is None:
+        return  # 編輯過的訊息；各 handler 都以 update.message 回覆
+    parts = message.text.split()
+    cmd, _, target = parts[0][1:].partition('@')
+    if target and target.lower() != context.bot.username.lower():
+        return  # 群組中指定給其他 bot 的指令
+    handler = COMMAND_MAP.get(cmd.lower())
+    if handler is None:
+        return
+    context.args = parts[1:]
+    await handler(update, context)
+
+
 # -------------------- 背景提醒任務 --------------------
 
-def schedule_periodic_checks(app: Application) -> None:
-    # 每 30 分鐘檢查一次是否需要提醒
-    async def check_and_notify():
-        try:
-            # 檢查餵食
-            if time_since_hours(state.get('last_feed')) >= FEED_THRESHOLD_HOURS:
-                # 發送提醒給最近互動的使用者；這裡示範發到預設 chat（需改成實際的 chat_id 管理）
-                # 若要針對每個使用者，請在 state['users'] 中儲存並逐一通知
+async def check_and_notify(context: ContextTypes.DEFAULT_TYPE) -> None:
+    # 每 CHECK_INTERVAL_MINUTES 分鐘檢查一次是否需要提醒
+    try:
+        now = time.time()
+        # 只有日誌受 LOG_LEVEL 影響，檢查本身一定要跑
+        log_info = logger.isEnabledFor(logging.INFO)
+        # 檢查餵食
+        if time_since_hours(state.get('last_feed'), now) >= FEED_THRESHOLD_HOURS:
+            # 發送提醒給最近互動的使用者；這裡示範發到預設 chat（需改成實際的 chat_id 管理）
+            # 若要針對每個使用者，請在 state['users'] 中儲存並逐一通知
+            if log_info:
                 logger.info('需要提醒餵食')
-                # 不直接發訊息於此函式，因為沒有 chat_id context；可擴充儲存 default_chat_id
-        except Exception:
-            logger.exception('check_and_notify error')
+            # 不直接發訊息於此函式，因為沒有 chat_id context；可擴充儲存 default_chat_id
+        if time_since_hours(state.get('last_drink'), now) >= DRINK_THRESHOLD_HOURS:
+            if log_info:
+                logger.info('需要提醒喝水')
+        if time_since_hours(state.get('last_sleep'), now) >= SLEEP_THRESHOLD_HOURS:
+            if log_info:
+                logger.info('需要提醒睡覺')
+    except Exception:
+        logger.exception('check_and_notify error')
+
 
-    # 加入到排程器（示範使用）
-    scheduler.add_job(check_and_notify, 'interval', minutes=30, id='periodic_check')
+# -------------------- 啟動／關閉 --------------------
+
+async def post_init(app: Application) -> None:
+    global _flush_task, _journal_task
+    _flush_task = asyncio.create_task(_flusher())
+    _journal_task = asyncio.create_task(_journal_writer())
+    # 還原尚未發送的提醒
+    for job_id, reminder in state['reminders'].items():
+        schedule_reminder(app.job_queue, job_id, reminder)
+
+
+async def post_shutdown(app: Application) -> None:
+    # 停掉背景寫入並強制寫出最後一次狀態
+    async with _state_lock:
+        # 持有 lock 時背景任務只可能停在等待中，不會取消到正在寫檔的 thread
+        for task in (_flush_task, _journal_task):
+            if task is not None:
+                task.cancel()
+                with suppress(asyncio.CancelledError):
+                    await task
+        _dirty.clear()
+        await compact_state()
+        # buffer 中的紀錄已套用到 state，包含在剛寫好的快照裡
+        _journal_buf.clear()
+    await HTTP.aclose()
 
 
 # -------------------- Main --------------------
 
 def main() -> None:
-    token = os.getenv('TELEGRAM_TOKEN')
-    if not token:
+    if not TELEGRAM_TOKEN:
         raise RuntimeError('請設定環境變數 TELEGRAM_TOKEN，內容為你的 Bot token')
 
-    app = Application.builder().token(token).build()
+    app = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     # 註冊 handlers
-    app.add_handler(CommandHandler('start', start))
-    app.add_handler(CommandHandler('help', help_command))
-    app.add_handler(CommandHandler('joke', joke_command))
-    app.add_handler(CommandHandler('feed', feed_command))
-    app.add_handler(CommandHandler('drink', drink_command))
-    app.add_handler(CommandHandler('sleep', sleep_command))
-    app.add_handler(CommandHandler('status', status_command))
-    app.add_handler(CommandHandler('remind', remind_command))
-    app.add_handler(CommandHandler('weather', weather_command))
-    app.add_handler(CommandHandler('google', google_command))
-    app.add_handler(CommandHandler('wiki', wiki_command))
-
+    # 與 CommandHandler 預設相同只處理一般訊息，不含頻道貼文
+    app.add_handler(MessageHandler(filters.COMMAND & filters.UpdateType.MESSAGES, dispatch_command))
     app.add_handler(CallbackQueryHandler(button_callback))
     app.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), text_message_handler))
 
     app.add_error_handler(error_handler)
 
-    # 啟動排程器
-    scheduler.start()
-    # 若需在排程中呼叫 bot，請在排程函式內使用 app.bot
-    # 範例：將周期檢查註冊為 startup job
-    app.job_queue.run_once(lambda ctx: schedule_periodic_checks(app), when=1)
+    # 週期檢查交給 Application 內建的 JobQueue
+    app.job_queue.run_repeating(check_and_notify, interval=CHECK_INTERVAL_MINUTES * 60, name='periodic_check')
 
     logger.info('Starting bot with polling...')
     app.run_polling()